@@ -3,8 +3,13 @@ import pandas as pd
 import glob
 import re
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
 from concurrent.futures import ProcessPoolExecutor
+from utils.indicators import INDICATOR_VERSION, kdj, rsi_wilder, sma, rolling_min, rolling_max
 
 # --- 实战优化配置 ---
 DATA_DIR = 'fund_data'
@@ -14,87 +19,151 @@ STOP_LOSS = -0.07             # 中线放宽止损，防止在底部被洗出
 # 量比逻辑：改为“不放量杀跌”
 VOL_LIMIT_UPPER = 1.1         # 不超过均量的1.1倍
 VOL_LIMIT_LOWER = 0.4         # 不低于0.4倍，防止僵尸股
+MIN_ROWS = 300                # 历史不足300根K线的不参与回测
+MIN_FILE_BYTES = 15000        # 每行至少约50字节，小于该大小的文件不可能有300行，免解析直接跳过
+USE_COLS = ['日期', '收盘', '最低', '成交量']  # 回测只需要这几列
+CSV_ENGINE = 'pyarrow'        # read_csv 使用 Arrow 解析器
+CACHE_DIR = 'fund_cache'      # prepare_cache.py 预计算的指标缓存目录
+DETAIL_FILE = 'backtest_detail.parquet'  # 逐笔交易明细，边回测边落盘
+CACHE_COLS = ['日期', '收盘', '最低', 'RSI', 'J', 'BIAS_20', 'VOL_RATIO']
+CODE_PATTERN = re.compile(r'(\d{6})')  # 从文件名提取6位代码，模块级预编译
+
+@dataclass(frozen=True)
+class ScoringConfig:
+    """一组回测参数；参数扫描时构造不同实例即可复用同一套指标与信号扫描，无需复制脚本"""
+    hold_days: tuple = tuple(HOLD_DAYS)
+    min_score: int = MIN_SCORE_THRESHOLD
+    stop_loss: float = STOP_LOSS
+    vol_lower: float = VOL_LIMIT_LOWER
+    vol_upper: float = VOL_LIMIT_UPPER
+    # 打分规则：(指标列, 低于该值, 加分)
+    score_rules: tuple = (('RSI', 35, 30), ('J', 5, 30), ('BIAS_20', -4, 40))
+
+DEFAULT_CONFIG = ScoringConfig()
 
 def calculate_tech(df):
-    df = df.sort_values('日期').copy()
-    # RSI & KDJ
-    delta = df['收盘'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-    df['RSI'] = 100 - (100 / (1 + (gain / loss)))
-    low_9 = df['收盘'].rolling(9).min()
-    high_9 = df['收盘'].rolling(9).max()
-    rsv = (df['收盘'] - low_9) / (high_9 - low_9) * 100
-    df['K'] = rsv.ewm(com=2, adjust=False).mean()
-    df['D'] = df['K'].ewm(com=2, adjust=False).mean()
-    df['J'] = 3 * df['K'] - 2 * df['D']
+    # fund_data 的 CSV 本身按日期升序，已有序时直接在原表上加列，省掉一次整表排序+拷贝
+    dates = df['日期'].to_numpy()
+    if not (dates[1:] >= dates[:-1]).all():
+        df = df.iloc[np.argsort(dates, kind='stable')].copy()
+    close = df['收盘'].to_numpy(np.float64)
+    vol = df['成交量'].to_numpy(np.float64)
+    # RSI & KDJ（K/D/MA20/V_MA5 只作中间量，不落成列，减小每个文件的工作集）
+    low_9 = rolling_min(close, 9)
+    high_9 = rolling_max(close, 9)
+    # RSI 用 Wilder 平滑（单趟 numba 递推）
+    df['RSI'] = rsi_wilder(close, 14)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (close - low_9) / (high_9 - low_9) * 100
+    df['J'] = kdj(rsv)[2]
     # 乖离与量比
-    df['MA20'] = df['收盘'].rolling(20).mean()
-    df['BIAS_20'] = (df['收盘'] - df['MA20']) / df['MA20'] * 100
-    df['V_MA5'] = df['成交量'].shift(1).rolling(5).mean()
-    df['VOL_RATIO'] = df['成交量'] / df['V_MA5']
+    ma20 = sma(close, 20)
+    df['BIAS_20'] = (close - ma20) / ma20 * 100
+    v_ma5 = sma(np.concatenate([[np.nan], vol[:-1]]), 5)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['VOL_RATIO'] = vol / v_ma5
     return df
 
-def run_single_backtest(file_path):
-    trades = []
+def cache_path_for(code):
+    """指标缓存路径；文件名带指标公式版本，公式改动后旧缓存视为未命中"""
+    return os.path.join(CACHE_DIR, f'{code}.v{INDICATOR_VERSION}.parquet')
+
+def read_cache(code, file_path):
+    """读取指标缓存；缓存不存在、版本不符或早于源 CSV 时返回 None"""
+    cache_path = cache_path_for(code)
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(file_path):
+        return None
+    return pd.read_parquet(cache_path, columns=CACHE_COLS)
+
+def run_single_backtest(file_path, config=DEFAULT_CONFIG):
     try:
-        code = re.search(r'(\d{6})', os.path.basename(file_path)).group(1)
-        df = pd.read_csv(file_path)
-        if len(df) < 300: return []
-        df = calculate_tech(df)
-        
-        for i in range(20, len(df) - max(HOLD_DAYS)):
-            row = df.iloc[i]
-            prev = df.iloc[i-1]
-            
-            score = 0
-            if row['RSI'] < 35: score += 30
-            if row['J'] < 5: score += 30
-            if row['BIAS_20'] < -4: score += 40
-            
-            # 核心改进：取消极致缩量，改为“不放量且不极端缩量”
-            is_vol_safe = VOL_LIMIT_LOWER < row['VOL_RATIO'] < VOL_LIMIT_UPPER
-            
-            # 右侧确认信号
-            if score >= MIN_SCORE_THRESHOLD and is_vol_safe and row['J'] > prev['J']:
-                buy_price = row['收盘']
-                res = {'代码': code, '日期': row['日期']}
-                for d in HOLD_DAYS:
-                    period_df = df.iloc[i+1 : i+d+1]
-                    # 检查是否触发止损
-                    if (period_df['最低'].min() - buy_price) / buy_price <= STOP_LOSS:
-                        res[f'{d}日收益%'] = STOP_LOSS * 100
-                    else:
-                        res[f'{d}日收益%'] = round((df.iloc[i+d]['收盘'] - buy_price) / buy_price * 100, 2)
-                trades.append(res)
-    except: pass
-    return trades
+        code = CODE_PATTERN.search(os.path.basename(file_path)).group(1)
+        if os.path.getsize(file_path) < MIN_FILE_BYTES: return None
+        df = read_cache(code, file_path)
+        if df is None:
+            df = pd.read_csv(file_path, engine=CSV_ENGINE, usecols=USE_COLS, dtype={'日期': str})
+        if len(df) < MIN_ROWS: return None
+        if 'RSI' not in df: df = calculate_tech(df)
+
+        close = df['收盘'].to_numpy(np.float64)
+        low = df['最低'].to_numpy(np.float64)
+        j = df['J'].to_numpy(np.float64)
+        vol_ratio = df['VOL_RATIO'].to_numpy(np.float64)
+        n = len(close)
+
+        # 整列打分，替代逐行 iloc 循环
+        score = sum(pts * (df[col].to_numpy(np.float64) < thr) for col, thr, pts in config.score_rules)
+        # 核心改进：取消极致缩量，改为“不放量且不极端缩量”
+        is_vol_safe = (vol_ratio > config.vol_lower) & (vol_ratio < config.vol_upper)
+        # 右侧确认信号
+        j_up = np.zeros(n, dtype=bool)
+        j_up[1:] = j[1:] > j[:-1]
+        mask = (score >= config.min_score) & is_vol_safe & j_up
+        mask[:20] = False
+        mask[max(20, n - max(config.hold_days)):] = False
+
+        idx = np.flatnonzero(mask)
+        if idx.size == 0: return None
+        hold = np.asarray(config.hold_days)
+        buy_price = close[idx][:, None]
+        # 一次花式索引取出所有持有周期的卖出价：shape = (信号数, len(hold_days))
+        sell_price = close[idx[:, None] + hold[None, :]]
+        # 检查是否触发止损：i+1..i+d 的最低价 = 截至 i+d 的 d 日滚动最小值再前移 d 日
+        low_s = pd.Series(low)
+        period_low = np.column_stack([low_s.rolling(d).min().shift(-d).to_numpy()[idx] for d in config.hold_days])
+        rets = np.where((period_low - buy_price) / buy_price <= config.stop_loss, config.stop_loss * 100,
+                        np.round((sell_price - buy_price) / buy_price * 100, 2))
+        # 按列返回类型化数组，避免逐笔 dict 的序列化与组装开销
+        return np.full(idx.size, code), df['日期'].to_numpy()[idx], rets
+    except (OSError, ValueError, KeyError, AttributeError, pd.errors.ParserError) as e:
+        # 只吞掉数据/文件层面的问题；MemoryError、numba 编译错误、Ctrl+C 照常抛出
+        print(f"{file_path} 回测跳过: {type(e).__name__}: {e}")
+        return None
+
+def _init_worker():
+    """子进程启动时预热 numba 内核，编译/加载缓存的开销每个进程只付一次"""
+    kdj(np.zeros(2))
+    rsi_wilder(np.zeros(2), 14)
+
+def main(config=DEFAULT_CONFIG):
+    # 先按文件大小剔除短历史文件，剩下的任务量更均匀，chunksize 也更准
+    files = [f for f in glob.glob(os.path.join(DATA_DIR, "*.csv")) if os.path.getsize(f) >= MIN_FILE_BYTES]
+    cols = [f'{d}日收益%' for d in config.hold_days]
+    schema = pa.schema([('代码', pa.string()), ('日期', pa.string())] + [(c, pa.float64()) for c in cols])
+    # 汇总所需的计数/求和随每批写入增量累加，统计时不再把明细整表读回内存
+    n_trades = 0
+    wins = np.zeros(len(cols), dtype=np.int64)
+    total = np.zeros(len(cols))
+    first_day = last_day = None
+    workers = os.cpu_count() or 1
+    chunk = max(1, len(files) // (workers * 4))
+    # 每个文件的结果到达即写入 Parquet，内存里只保留一个文件的交易
+    with pq.ParquetWriter(DETAIL_FILE, schema, compression='zstd') as writer, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for result in executor.map(partial(run_single_backtest, config=config), files, chunksize=chunk):
+            if result is None: continue
+            codes, dates, rets = result
+            writer.write_table(pa.Table.from_pydict(
+                {'代码': codes, '日期': dates, **{c: rets[:, k] for k, c in enumerate(cols)}}, schema=schema))
+            n_trades += len(codes)
+            wins += (rets > 0).sum(axis=0)
+            total += rets.sum(axis=0)
+            # 日期为 YYYY-MM-DD 字符串，按字符串比较即按时间先后
+            lo, hi = min(dates), max(dates)
+            first_day = lo if first_day is None else min(first_day, lo)
+            last_day = hi if last_day is None else max(last_day, hi)
 
-def main():
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    all_trades = []
-    with ProcessPoolExecutor() as executor:
-        for result in executor.map(run_single_backtest, files):
-            all_trades.extend(result)
-            
-    if all_trades:
-        res_df = pd.DataFrame(all_trades).sort_values('日期')
-        summary = []
-        for d in HOLD_DAYS:
-            col = f'{d}日收益%'
-            win_rate = (res_df[col] > 0).mean() * 100
-            avg_ret = res_df[col].mean()
-            # 统计时间跨度
-            total_days = (pd.to_datetime(res_df['日期'].max()) - pd.to_datetime(res_df['日期'].min())).days
-            monthly_signals = len(res_df) / (total_days / 30) if total_days > 0 else 0
-            
-            summary.append({
-                '周期': f'{d}天', 
-                '月均信号': round(monthly_signals, 1),
-                '胜率%': round(win_rate, 2), 
-                '平均收益%': round(avg_ret, 2)
-            })
-        print(pd.DataFrame(summary).to_string(index=False))
+    if n_trades:
+        # 统计时间跨度
+        total_days = (pd.to_datetime(last_day) - pd.to_datetime(first_day)).days
+        monthly_signals = n_trades / (total_days / 30) if total_days > 0 else 0
+        summary = pd.DataFrame({
+            '周期': [f'{d}天' for d in config.hold_days],
+            '月均信号': round(monthly_signals, 1),
+            '胜率%': np.round(wins / n_trades * 100, 2),
+            '平均收益%': np.round(total / n_trades, 2)
+        })
+        print(summary.to_string(index=False))
 
 if __name__ == "__main__":
     main()
@@ -2,9 +2,14 @@ import os
 import pandas as pd
 import glob
 import re
+import mmap
 import numpy as np
-from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from utils._njit import njit
+from utils.indicators import INDICATOR_VERSION, ewm_com2_step, rsi_wilder_step
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # --- 配置 ---
 DATA_DIR = 'fund_data'
@@ -13,160 +18,325 @@ PORTFOLIO_FILE = 'virtual_portfolio.csv'
 MIN_TURNOVER = 5000000       
 MIN_SCORE_SIGNAL = 78      
 TARGET_PROFIT = 5.0  # 自动止盈目标 %
+MIN_BYTES = 1600     # 表头+40行数据至少这么大，更小的文件不足40行，不分发给子进程
+PEEK_BYTES = 512     # 预检成交额时读取的首/尾字节数，足够覆盖表头+首行、最后一行
+# Arrow CSV 读取选项：只解析指标用到的列并固定类型（日期解析为 date32，有序检查和取最新日都是整数比较）；进程池已并行，关闭读取线程
+READ_OPTIONS = pacsv.ReadOptions(use_threads=False)
+CONVERT_OPTIONS = pacsv.ConvertOptions(
+    include_columns=['日期', '收盘', '最高', '最低', '成交量', '成交额'],
+    column_types={'日期': pa.date32(), '收盘': pa.float64(), '最高': pa.float64(), '最低': pa.float64(),
+                  '成交量': pa.float64(), '成交额': pa.float64()})
+# _tech_tail 返回的指标顺序
+TECH_COLS = ['RSI', 'K', 'D', 'J', 'MA5', 'MA20', 'BIAS_20', 'V_MA5', 'VOL_RATIO']
+# ETF 列表行解析：代码后跟空白和名称
+_CODE_NAME_RE = re.compile(r'(\d{6})\s+(.+)')
+# 文件名中的6位代码
+_CODE_RE = re.compile(r'(\d{6})')
+# calculate_tech 结果（最新两行）的缓存目录：缓存不比 CSV 旧且指标版本一致时直接读取，跳过解析和指标计算
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+# 结果列顺序，score_signal 按此顺序返回元组
+COLUMNS = ['代码', '名称', '信号强度', '操作建议', '综合评分', '建议止损价', '现价', 'RSI', 'KDJ_J', 'MA20偏离%', '当前量比', '日期']
+# 持仓账本列顺序
+PORTFOLIO_COLS = ['代码', '名称', '买入日期', '买入价', '当前价', '止损价', '持有天数', '当前收益%', '信号类型', '状态']
 
 def get_target_mapping():
     if not os.path.exists(ETF_LIST_FILE): return {}
-    mapping = {}
-    for enc in ['utf-8', 'gbk', 'utf-16']:
-        try:
-            with open(ETF_LIST_FILE, 'r', encoding=enc) as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or "证券代码" in line: continue
-                    match = re.search(r'(\d{6})\s+(.+)', line)
-                    if match:
-                        code, name = match.groups()
-                        mapping[code] = name.strip()
-            if mapping: return mapping
-        except: continue
+    # 只读一次原始字节；带 BOM 时编码已确定，否则依次尝试解码，解码失败才换下一种编码
+    with open(ETF_LIST_FILE, 'rb') as f: data = f.read()
+    if data.startswith((b'\xff\xfe', b'\xfe\xff')): encodings = ['utf-16']
+    elif data.startswith(b'\xef\xbb\xbf'): encodings = ['utf-8-sig']
+    else: encodings = ['utf-8', 'gbk', 'utf-16']
+    for enc in encodings:
+        try: text = data.decode(enc)
+        except UnicodeDecodeError: continue
+        mapping = {}
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or "证券代码" in line: continue
+            # 常见格式“代码<空白>名称”直接 split，其余格式再走预编译正则
+            parts = line.split(None, 1)
+            if len(parts) == 2 and len(parts[0]) == 6 and parts[0].isdigit():
+                mapping[parts[0]] = parts[1].strip()
+                continue
+            match = _CODE_NAME_RE.search(line)
+            if match:
+                code, name = match.groups()
+                mapping[code] = name.strip()
+        if mapping: return mapping
     return {}
 
-def calculate_tech(df):
-    df = df.sort_values('日期').copy()
-    delta = df['收盘'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-    df['RSI'] = 100 - (100 / (1 + (gain / loss)))
-    low_9 = df['最低'].rolling(9).min()
-    high_9 = df['最高'].rolling(9).max()
-    rsv = (df['收盘'] - low_9) / (high_9 - low_9) * 100
-    df['K'] = rsv.ewm(com=2, adjust=False).mean()
-    df['D'] = df['K'].ewm(com=2, adjust=False).mean()
-    df['J'] = 3 * df['K'] - 2 * df['D']
-    df['MA5'] = df['收盘'].rolling(5).mean()
-    df['MA20'] = df['收盘'].rolling(20).mean()
-    df['BIAS_20'] = (df['收盘'] - df['MA20']) / df['MA20'] * 100
-    df['V_MA5'] = df['成交量'].shift(1).rolling(5).mean()
-    df['VOL_RATIO'] = df['成交量'] / df['V_MA5']
-    return df.sort_values('日期', ascending=False).reset_index(drop=True)
-
-def update_portfolio(new_signals):
-    """更新虚拟持仓账本，并包含自动止盈止损逻辑"""
-    cols = ['代码', '名称', '买入日期', '买入价', '当前价', '止损价', '持有天数', '当前收益%', '信号类型', '状态']
-    
-    if os.path.exists(PORTFOLIO_FILE):
-        try:
-            df_p = pd.read_csv(PORTFOLIO_FILE)
-            # 兼容旧版本格式
-            if '状态' not in df_p.columns: df_p['状态'] = '持仓中'
-            if '止损价' not in df_p.columns: df_p['止损价'] = df_p['买入价'] * 0.95
-        except:
-            df_p = pd.DataFrame(columns=cols)
-    else:
-        df_p = pd.DataFrame(columns=cols)
-
-    # 1. 存入新信号
-    new_entries = []
-    for s in new_signals:
-        if s['综合评分'] >= MIN_SCORE_SIGNAL:
-            code_str = str(s['代码']).zfill(6)
-            # 查重：只记录“持仓中”且日期不同的
-            is_holding = False
-            if not df_p.empty:
-                is_holding = ((df_p['代码'].astype(str).str.zfill(6) == code_str) & (df_p['状态'] == '持仓中')).any()
-            
-            if not is_holding:
-                new_entries.append({
-                    '代码': code_str, '名称': s['名称'], '买入日期': s['日期'],
-                    '买入价': s['现价'], '当前价': s['现价'], '止损价': s['建议止损价'],
-                    '持有天数': 0, '当前收益%': 0.0, '信号类型': s['信号强度'], '状态': '持仓中'
-                })
-    
-    if new_entries:
-        df_p = pd.concat([df_p, pd.DataFrame(new_entries)], ignore_index=True)
-
-    # 2. 刷新所有“持仓中”的记录
-    if not df_p.empty:
-        files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-        for idx, row in df_p.iterrows():
-            if row['状态'] != '持仓中': continue
-            
-            code_str = str(row['代码']).zfill(6)
-            target_file = [f for f in files if code_str in f]
-            if target_file:
-                df_temp = pd.read_csv(target_file[0])
-                if not df_temp.empty:
-                    last_row = df_temp.iloc[-1]
-                    cur_price = last_row['收盘']
-                    cur_date = last_row['日期']
-                    
-                    d1 = datetime.strptime(str(row['买入日期']), '%Y-%m-%d')
-                    d2 = datetime.strptime(str(cur_date), '%Y-%m-%d')
-                    
-                    profit = round((cur_price - row['买入价']) / row['买入价'] * 100, 2)
-                    df_p.at[idx, '当前价'] = cur_price
-                    df_p.at[idx, '持有天数'] = (d2 - d1).days
-                    df_p.at[idx, '当前收益%'] = profit
-
-                    # 判定平仓逻辑
-                    if cur_price < row['止损价']:
-                        df_p.at[idx, '状态'] = '止损退出'
-                    elif profit >= TARGET_PROFIT:
-                        df_p.at[idx, '状态'] = '止盈退出'
+@njit(cache=True)
+def _window_mean(x, start, stop):
+    """x[start:stop] 的均值，逐个顺序累加：编译与否结果逐位一致（NumPy 的 sum 是分块两两相加）"""
+    total = 0.0
+    for i in range(start, stop):
+        total += x[i]
+    return total / (stop - start)
+
+@njit(cache=True, error_model='numpy')
+def _tech_tail(close, high, low, vol):
+    """
+    数组按日期升序。一趟递推 RSI(14, Wilder) 与 KDJ(9,3,3)，MA5/MA20/V_MA5 只对最后两天求窗口均值；
+    返回最后两天（新到旧）的 (RSI, K, D, J, MA5, MA20, BIAS_20, V_MA5, VOL_RATIO)，各为长度 2 的数组
+    """
+    n = close.size
+    out = np.full((9, 2), np.nan)
+    avg_gain, avg_loss = 0.0, 0.0
+    k, k_wt, d, d_wt = np.nan, 1.0, np.nan, 1.0
+    for i in range(n):
+        rsi = np.nan
+        if i > 0:
+            avg_gain, avg_loss, rsi = rsi_wilder_step(avg_gain, avg_loss, i, close[i] - close[i - 1], 14)
+        # 9 日 RSV：窗口内有缺失值时记 NaN；最高等于最低时与 0/0 一样是 NaN
+        rsv = np.nan
+        if i >= 8:
+            lo, hi = low[i], high[i]
+            bad = lo != lo or hi != hi
+            for w in range(i - 8, i):
+                if low[w] != low[w] or high[w] != high[w]: bad = True
+                if low[w] < lo: lo = low[w]
+                if high[w] > hi: hi = high[w]
+            if not bad and hi != lo: rsv = (close[i] - lo) / (hi - lo) * 100
+        k, k_wt = ewm_com2_step(k, k_wt, rsv)
+        d, d_wt = ewm_com2_step(d, d_wt, k)
+        if i >= n - 2:
+            s = n - 1 - i
+            out[0, s], out[1, s], out[2, s], out[3, s] = rsi, k, d, 3 * k - 2 * d
+            if i >= 4: out[4, s] = _window_mean(close, i - 4, i + 1)
+            if i >= 19:
+                out[5, s] = _window_mean(close, i - 19, i + 1)
+                out[6, s] = (close[i] - out[5, s]) / out[5, s] * 100
+            if i >= 5:
+                out[7, s] = _window_mean(vol, i - 5, i)
+                out[8, s] = vol[i] / out[7, s]
+    return out
+
+def calculate_tech(cols):
+    """cols 为按文件原顺序的 {列名: 数组}；返回最新两行（新到旧）的 {列名: 长度为 2 的数组}，含全部指标"""
+    dates = cols['日期']
+    # CSV 通常已按日期升序：有序时直接取数组，否则按日期稳定排序一次
+    order = slice(None) if (dates[1:] >= dates[:-1]).all() else np.argsort(dates, kind='stable')
+    arrs = {c: v[order] for c, v in cols.items()}
+    tail = _tech_tail(arrs['收盘'], arrs['最高'], arrs['最低'], arrs['成交量'])
+    last_two = {c: v[-1:-3:-1] for c, v in arrs.items()}
+    # 只有输出的两行日期转回 YYYY-MM-DD 字符串
+    last_two['日期'] = np.datetime_as_string(last_two['日期'])
+    last_two.update(zip(TECH_COLS, tail))
+    return last_two
+
+def _load_portfolio():
+    """读取持仓账本；文件不存在或无法解析时返回空账本"""
+    if not os.path.exists(PORTFOLIO_FILE): return pd.DataFrame(columns=PORTFOLIO_COLS)
+    try:
+        df_p = pd.read_csv(PORTFOLIO_FILE)
+        # 兼容旧版本格式
+        if '状态' not in df_p.columns: df_p['状态'] = '持仓中'
+        if '止损价' not in df_p.columns: df_p['止损价'] = df_p['买入价'] * 0.95
+        return df_p
+    except:
+        return pd.DataFrame(columns=PORTFOLIO_COLS)
+
+def _apply_signals(df_p, signals):
+    """存入新信号：达到评分门槛、且没有同代码“持仓中”记录的信号整批建表，一次拼接"""
+    if signals.empty: return df_p
+    held = df_p.loc[df_p['状态'] == '持仓中', '代码'].astype(str).str.zfill(6)
+    new = signals[signals['综合评分'] >= MIN_SCORE_SIGNAL]
+    code_str = new['代码'].astype(str).str.zfill(6)
+    new, code_str = new[~code_str.isin(held)], code_str[~code_str.isin(held)]
+    if new.empty: return df_p
+    entries = pd.DataFrame({
+        '代码': code_str.to_numpy(), '名称': new['名称'].to_numpy(), '买入日期': new['日期'].to_numpy(),
+        '买入价': new['现价'].to_numpy(), '当前价': new['现价'].to_numpy(), '止损价': new['建议止损价'].to_numpy(),
+        '持有天数': 0, '当前收益%': 0.0, '信号类型': new['信号强度'].to_numpy(), '状态': '持仓中'})
+    # 账本为空时新表直接作为账本，省掉与空表拼接的一次拷贝和类型推断
+    return entries if df_p.empty else pd.concat([df_p, entries], ignore_index=True)
+
+def _refresh_prices(df_p, latest=None):
+    """刷新所有“持仓中”的记录（原地修改并返回）：最新价优先取 latest，只有缺失的代码才回读文件最后一行"""
+    if df_p.empty: return df_p
+    codes = df_p['代码'].astype(str).str.zfill(6)
+    active = (df_p['状态'] == '持仓中').to_numpy()
+    latest = dict(latest or {})
+    missing = set(codes[active]) - latest.keys()
+    code_files = {}
+    if missing:
+        for f in glob.glob(os.path.join(DATA_DIR, "*.csv")):
+            m = _CODE_RE.search(os.path.basename(f))
+            if m: code_files.setdefault(m.group(1), f)
+    # 回读的都是小块 mmap 读取，I/O 期间释放 GIL，用线程池并发即可，无需进程间传数据
+    todo = sorted(missing & code_files.keys())
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(32, len(todo))) as ex:
+            for code, row in zip(todo, ex.map(tail_price, [code_files[c] for c in todo])):
+                if row: latest[code] = row
 
+    hit = active & codes.isin(latest.keys()).to_numpy()
+    if hit.any():
+        cur_price, cur_date = (np.array(v) for v in zip(*(latest[c] for c in codes[hit])))
+        buy = df_p.loc[hit, '买入价'].to_numpy(dtype=np.float64)
+        profit = np.round((cur_price - buy) / buy * 100, 2)
+        # 日期本身就是 YYYY-MM-DD，整列转 datetime64[D] 相减即持有天数
+        days = (cur_date.astype('datetime64[D]') -
+                df_p.loc[hit, '买入日期'].astype(str).to_numpy().astype('datetime64[D]')).astype(np.int64)
+        df_p.loc[hit, '当前价'] = cur_price
+        df_p.loc[hit, '持有天数'] = days
+        df_p.loc[hit, '当前收益%'] = profit
+
+        # 判定平仓逻辑：跌破止损优先，其次达到止盈目标
+        stop = cur_price < df_p.loc[hit, '止损价'].to_numpy(dtype=np.float64)
+        status = np.where(stop, '止损退出', np.where(profit >= TARGET_PROFIT, '止盈退出', '持仓中'))
+        df_p.loc[hit, '状态'] = status
+    return df_p
+
+def _save_portfolio(df_p):
     df_p.to_csv(PORTFOLIO_FILE, index=False, encoding='utf-8-sig')
+
+def update_portfolio(signals, latest=None, df_p=None, save=True):
+    """更新虚拟持仓账本，并包含自动止盈止损逻辑；signals 为按分析顺序排列的信号表，
+    latest 为分析阶段已算出的 {代码: (最新收盘, 最新日期)}。
+    传入 df_p 时不读文件、save=False 时不落盘，回放时可连续调用、最后再保存一次"""
+    if df_p is None: df_p = _load_portfolio()
+    df_p = _refresh_prices(_apply_signals(df_p, signals), latest)
+    if save: _save_portfolio(df_p)
     return df_p
 
+def tail_turnover(file_path):
+    """只映射文件首尾：表头定位列，取最后一行的成交额；文件看起来不是按日期升序（或无法判断）时返回 None"""
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        head = mm[:PEEK_BYTES].split(b'\n', 2)
+        tail = mm[-PEEK_BYTES:].rstrip().rsplit(b'\n', 1)[-1]
+    if len(head) < 3: return None
+    try:
+        cols = head[0].decode('utf-8-sig').strip().split(',')
+        i_date, i_amt = cols.index('日期'), cols.index('成交额')
+        first, last = head[1].strip().split(b','), tail.strip().split(b',')
+        # 最后一行日期不早于首行，才认为它就是最新交易日
+        if last[i_date] < first[i_date]: return None
+        return float(last[i_amt])
+    except (ValueError, IndexError): return None
+
+def tail_price(file_path):
+    """只映射文件首尾：表头定位列，返回最后一行的 (收盘, 日期)；没有数据行或无法解析时返回 None"""
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header = mm[:PEEK_BYTES].split(b'\n', 1)[0].strip()
+        tail = mm[-PEEK_BYTES:].rstrip().rsplit(b'\n', 1)[-1].strip()
+    if tail == header: return None
+    try:
+        cols = header.decode('utf-8-sig').split(',')
+        last = tail.split(b',')
+        return float(last[cols.index('收盘')]), last[cols.index('日期')].decode()
+    except (ValueError, IndexError): return None
+
+def _columns(table):
+    return {name: col.to_numpy(zero_copy_only=False) for name, col in zip(table.column_names, table.columns)}
+
+def load_tech(file_path, code):
+    """返回最新两行（新到旧）的 {列名: 数组}，含全部指标；历史过短或成交额不足时返回 None"""
+    cache_path = os.path.join(CACHE_DIR, f'{code}.tech.v{INDICATOR_VERSION}.parquet')
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+            # 阈值可能在两次运行间调整过，命中缓存也按当前 MIN_TURNOVER 再过滤一次
+            tech = _columns(pq.read_table(cache_path))
+            return tech if tech['成交额'][0] >= MIN_TURNOVER else None
+    except OSError: pass
+    # 只看文件末行就能判定流动性不足的，直接跳过，不解析整个文件
+    amt = tail_turnover(file_path)
+    if amt is not None and amt < MIN_TURNOVER: return None
+    # 经 Arrow 内存映射直接解析页缓存里的字节；Arrow 列直接转 NumPy 数组，全程不构造 DataFrame
+    with pa.memory_map(file_path) as source:
+        table = pacsv.read_csv(source, read_options=READ_OPTIONS, convert_options=CONVERT_OPTIONS)
+    if table.num_rows < 40: return None
+    cols = _columns(table)
+    # 先按最新交易日的成交额过滤，流动性不足的标的不再计算指标
+    if float(cols['成交额'][cols['日期'].argmax()]) < MIN_TURNOVER: return None
+    tech = calculate_tech(cols)
+    # 先写临时文件再替换，并发或中断时不会留下半截缓存
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f'{cache_path}.{os.getpid()}.tmp'
+    pq.write_table(pa.table(tech), tmp)
+    os.replace(tmp, cache_path)
+    return tech
+
+_NAME_MAP = {}  # 子进程内的 {代码: 名称}，由 _init_worker 每个进程设置一次
+
+def _init_worker(name_mapping):
+    global _NAME_MAP
+    _NAME_MAP = name_mapping
+    # 预热 numba 内核（cache=True 时直接加载磁盘缓存），避免首个文件承担编译耗时
+    _tech_tail(np.ones(30), np.ones(30), np.ones(30), np.ones(30))
+
 # ... analyze_single_file (维持原样，确保输出建议止损价) ...
-def analyze_single_file(file_info):
-    file_path, name_mapping = file_info
+def score_signal(code, tech):
+    """按最新两行的指标评分，返回 COLUMNS 顺序的信号元组；没有信号时返回 None"""
+    # 按数组位置取最新一行的标量（NumPy float64），不经过 Series
+    last = {c: v[0] for c, v in tech.items()}
+    prev_j = tech['J'][1]
+
+    # 超跌评分：各条件的布尔值直接加权求和，不走分支
+    score_oversold = int(35 * (last['RSI'] < 38) + 35 * (last['J'] < 10) + 30 * (last['BIAS_20'] < -3))
+    
+    is_strong = last['RSI'] > 65 and last['收盘'] > last['MA5']
+    
+    if score_oversold >= 70 and last['J'] > prev_j:
+        sig, adv, score, sl = "★★★ 超跌反弹", "底部确认。", score_oversold, last['最低']
+    elif last['RSI'] > 80:
+        sig, adv, score, sl = "☢ 极致超买", "博傻阶段。", -20, round(last['MA5'], 3)
+    elif is_strong:
+        sig, adv, score, sl = "🚀 趋势主升", "动能强。", 65, round(last['MA5'], 3)
+    else: return None
+
+    # 按 COLUMNS 顺序返回元组，比 dict 更小，跨进程传回的数据也更少
+    return (code, _NAME_MAP.get(code, "未知"), sig, adv, score, sl,
+            last['收盘'], round(last['RSI'], 2), round(last['J'], 2),
+            round(last['BIAS_20'], 2), round(last['VOL_RATIO'], 2), last['日期'])
+
+def analyze_single_file(file_path):
+    """返回 (代码, 最新收盘, 最新日期, 信号元组或 None)；数据不足、成交额不足或读取失败时返回 None"""
+    m = _CODE_RE.search(os.path.basename(file_path))
+    if not m: return None
+    code = m.group(1)
     try:
-        code = re.search(r'(\d{6})', os.path.basename(file_path)).group(1)
-        df = pd.read_csv(file_path)
-        if len(df) < 40: return None
-        df = calculate_tech(df)
-        last = df.iloc[0]; prev = df.iloc[1]
-        if float(last['成交额']) < MIN_TURNOVER: return None
-
-        score_oversold = 0
-        if last['RSI'] < 38: score_oversold += 35
-        if last['J'] < 10: score_oversold += 35
-        if last['BIAS_20'] < -3: score_oversold += 30
-        
-        is_strong = last['RSI'] > 65 and last['收盘'] > last['MA5']
-        
-        if score_oversold >= 70 and last['J'] > prev['J']:
-            sig, adv, score, sl = "★★★ 超跌反弹", "底部确认。", score_oversold, last['最低']
-        elif last['RSI'] > 80:
-            sig, adv, score, sl = "☢ 极致超买", "博傻阶段。", -20, round(last['MA5'], 3)
-        elif is_strong:
-            sig, adv, score, sl = "🚀 趋势主升", "动能强。", 65, round(last['MA5'], 3)
-        else: return None
-
-        return {
-            '代码': code, '名称': name_mapping.get(code, "未知"), '信号强度': sig,
-            '操作建议': adv, '综合评分': score, '建议止损价': sl,
-            '现价': last['收盘'], 'RSI': round(last['RSI'], 2), 'KDJ_J': round(last['J'], 2),
-            'MA20偏离%': round(last['BIAS_20'], 2), '当前量比': round(last['VOL_RATIO'], 2),
-            '日期': last['日期']
-        }
-    except: return None
+        tech = load_tech(file_path, code)
+        if tech is None: return None
+        return code, tech['收盘'][0], tech['日期'][0], score_signal(code, tech)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        # 只吞掉数据/文件层面的问题(pyarrow 的解析错误分别继承自这几类)；numba 编译/类型错误、MemoryError、Ctrl+C 照常抛出
+        print(f"{file_path} 分析跳过: {type(e).__name__}: {e}")
+        return None
+
+def worker_count():
+    """进程数可用环境变量 ETF_WORKERS 覆盖（例如磁盘较慢时适当超配）；未设置、为空、为 0 或不是整数时取 CPU 核数，负数按 1"""
+    raw = os.environ.get('ETF_WORKERS')
+    try: n = int(raw or 0)
+    except ValueError:
+        print(f"ETF_WORKERS={raw!r} 不是整数，改用 CPU 核数")
+        n = 0
+    return max(1, n) if n else (os.cpu_count() or 1)
 
 def main():
     name_mapping = get_target_mapping()
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    tasks = [(f, name_mapping) for f in files]
+    files = [f for f in glob.glob(os.path.join(DATA_DIR, "*.csv")) if os.path.getsize(f) >= MIN_BYTES]
 
     print(f"🚀 复盘中...")
     results = []
-    with ProcessPoolExecutor() as executor:
-        for res in executor.map(analyze_single_file, tasks):
-            if res: results.append(res)
+    latest = {}
+    # 名称映射经 initializer 每个进程只传一次，任务只携带文件路径
+    workers = worker_count()
+    chunk = max(1, len(files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(name_mapping,)) as executor:
+        for res in executor.map(analyze_single_file, files, chunksize=chunk):
+            if res is None: continue
+            code, close, day, signal = res
+            # 同一代码有多个文件时与持仓刷新一致，取 glob 顺序中的第一个
+            latest.setdefault(code, (close, day))
+            if signal: results.append(signal)
 
-    res_df = pd.DataFrame(results).sort_values(by='综合评分', ascending=False) if results else pd.DataFrame()
+    # 元组按列转置后一次组装成表，跳过逐个 dict 的键对齐
+    sig_df = pd.DataFrame({c: list(v) for c, v in zip(COLUMNS, zip(*results))}) if results else pd.DataFrame()
+    res_df = sig_df.sort_values(by='综合评分', ascending=False) if results else sig_df
     res_df.to_csv('investment_decision.csv', index=False, encoding='utf-8-sig')
     
-    portfolio_df = update_portfolio(results)
+    portfolio_df = update_portfolio(sig_df, latest)
     
     print(f"✅ 完成！")
     if not portfolio_df.empty:
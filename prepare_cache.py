@@ -0,0 +1,30 @@
+import os
+import glob
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from backtest_engine import DATA_DIR, CACHE_DIR, CACHE_COLS, USE_COLS, CSV_ENGINE, CODE_PATTERN, cache_path_for, calculate_tech
+
+# 指标与回测参数(阈值/持有天数/量比区间)无关，预计算一次后各轮回测直接读 Parquet
+
+def build_cache(file_path):
+    """计算单个 CSV 的指标并写入 fund_cache/{code}.v{INDICATOR_VERSION}.parquet"""
+    try:
+        code = CODE_PATTERN.search(os.path.basename(file_path)).group(1)
+        df = pd.read_csv(file_path, engine=CSV_ENGINE, usecols=USE_COLS, dtype={'日期': str})
+        df = calculate_tech(df)[CACHE_COLS]
+        df.to_parquet(cache_path_for(code), compression='snappy', index=False)
+        return f"{code} 缓存完成"
+    except (OSError, ValueError, KeyError, AttributeError, pd.errors.ParserError) as e:
+        # 与 run_single_backtest 一致：只吞掉数据/文件层面的问题
+        return f"{file_path} 缓存失败: {type(e).__name__}: {e}"
+
+def main():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
+    print(f"开始预计算 {len(files)} 个文件的指标缓存...")
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(build_cache, files))
+    print(f"完成: {sum('缓存完成' in r for r in results)}/{len(files)}")
+
+if __name__ == "__main__":
+    main()
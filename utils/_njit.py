@@ -0,0 +1,11 @@
+"""numba 可选加速：未安装 numba 时 njit 退化为原样返回函数，脚本照常运行"""
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        # 兼容 @njit 与 @njit(cache=True) 两种写法
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        def decorator(func):
+            return func
+        return decorator
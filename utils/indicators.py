@@ -0,0 +1,97 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from utils._njit import njit
+
+# 指标公式版本：改动任一指标的算法时加一；各脚本的缓存文件名带上该版本号，旧公式算出的缓存自然不再命中
+INDICATOR_VERSION = 2
+
+try:
+    import bottleneck as bn
+except ImportError:
+    bn = None
+
+
+def _rolling(x, n, reduce):
+    """前 n-1 位补 NaN 的滑窗归约，与 pandas rolling(n) 对齐，但不构造 Rolling 对象"""
+    out = np.full(x.shape, np.nan)
+    if x.size >= n:
+        out[n - 1:] = reduce(sliding_window_view(x, n), axis=1)
+    return out
+
+
+def sma(x, n):
+    """简单移动平均：有 bottleneck 时用 move_mean，否则退回滑窗均值；两者遇到中间的 NaN 都只影响含它的窗口，与 pandas rolling(n).mean() 一致"""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if bn is not None:
+        return bn.move_mean(x, n, min_count=n)
+    return _rolling(x, n, np.mean)
+
+
+def rolling_min(x, n):
+    """滑窗最小值：有 bottleneck 时用 move_min（O(n) 单调队列），否则滑窗归约"""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if bn is not None:
+        return bn.move_min(x, n, min_count=n)
+    return _rolling(x, n, np.min)
+
+
+def rolling_max(x, n):
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if bn is not None:
+        return bn.move_max(x, n, min_count=n)
+    return _rolling(x, n, np.max)
+
+
+@njit(cache=True)
+def ewm_com2_step(weighted, old_wt, v):
+    """pd.Series.ewm(com=2, adjust=False).mean() 的单步递推（含 NaN 处理），返回新的 (weighted, old_wt)"""
+    alpha = 1.0 / 3.0
+    if weighted == weighted:
+        old_wt *= 1.0 - alpha
+        if v == v:
+            if weighted != v:
+                weighted = (old_wt * weighted + alpha * v) / (old_wt + alpha)
+            old_wt = 1.0
+    elif v == v:
+        weighted = v
+    return weighted, old_wt
+
+
+@njit(cache=True)
+def kdj(rsv):
+    """K、D（两级 com=2 EWM）与 J 一趟算完，逐位等同两次 pandas ewm(com=2, adjust=False)；返回 (K, D, J)"""
+    n = rsv.size
+    k_out, d_out, j_out = np.empty(n), np.empty(n), np.empty(n)
+    k, k_wt, d, d_wt = np.nan, 1.0, np.nan, 1.0
+    for i in range(n):
+        k, k_wt = ewm_com2_step(k, k_wt, rsv[i])
+        d, d_wt = ewm_com2_step(d, d_wt, k)
+        k_out[i], d_out[i], j_out[i] = k, d, 3 * k - 2 * d
+    return k_out, d_out, j_out
+
+
+@njit(cache=True)
+def rsi_wilder_step(avg_gain, avg_loss, i, d, period=14):
+    """rsi_wilder 的单步递推：d 为第 i 个涨跌（i 从 1 起），返回新的 (avg_gain, avg_loss, rsi)；i < period 时 rsi 为 NaN"""
+    gain = d if d > 0 else 0.0
+    loss = -d if d < 0 else 0.0
+    if i < period:
+        return avg_gain + gain, avg_loss + loss, np.nan
+    if i == period:
+        avg_gain = (avg_gain + gain) / period
+        avg_loss = (avg_loss + loss) / period
+    else:
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
+    return avg_gain, avg_loss, 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+@njit(cache=True)
+def rsi_wilder(close, period=14):
+    """Wilder RSI：前 period 个涨跌的简单平均作初值，之后按 (avg*(period-1)+x)/period 递推；前 period 位为 NaN，均跌为 0 时记 100"""
+    n = close.size
+    out = np.full(n, np.nan)
+    avg_gain, avg_loss = 0.0, 0.0
+    for i in range(1, n):
+        avg_gain, avg_loss, out[i] = rsi_wilder_step(avg_gain, avg_loss, i, close[i] - close[i - 1], period)
+    return out